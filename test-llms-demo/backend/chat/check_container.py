@@ -1,12 +1,425 @@
 """
-Lambda function to inspect the container environment
-This shows what's actually running "under the hood"
+Lambda container inspection and warm-container runtime diagnostics
+
+Besides the static platform facts, this module keeps in-process stats for the
+real handlers while the container stays warm - the chat handler, the documents
+handler and the embeddings job (backend/documents/check_container.py is a
+symlink to this file, so both Lambda packages contain it):
+- invocation count since cold start and init duration
+- RSS and GC stats
+- connection-pool usage of registered boto3 clients
+- per-stage latency histograms
+- an on-demand profile (cProfile or a stack sampler) for the next N invocations
+
+The one cache in the project, the embedding cache, reports its hits and
+misses in the embeddings job summary rather than here.
+
+Wrap a handler with @instrument and invoke the function directly with
+    {"diagnostics": {}}
+to get the report, or
+    {"diagnostics": {"profile": {"invocations": 5, "mode": "sample"}}}
+to profile the next 5 invocations of that container. The profile shows up in
+the report once it finishes. Direct invocations aren't exposed through API
+Gateway.
 """
 
+import cProfile
+import gc
+import io
 import json
 import os
 import platform
+import pstats
+import resource
 import sys
+import threading
+import time
+import traceback
+from collections import Counter
+from contextlib import contextmanager
+from functools import wraps
+
+# Set when this module is first imported - i.e. during the cold start
+IMPORTED_AT = time.time()
+_imported_perf = time.perf_counter()
+
+# Latency histogram bucket upper bounds in milliseconds (last bucket is +inf)
+LATENCY_BUCKETS_MS = [5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 25000, 50000]
+
+SAMPLE_INTERVAL_SECONDS = 0.005
+MAX_PROFILE_INVOCATIONS = 1000
+TOP_PROFILE_ENTRIES = 25
+
+_lock = threading.Lock()
+_state = {
+    'init_duration_ms': None,
+    'invocations': 0,
+    'errors': 0,
+    'last_invocation_at': None
+}
+_histograms = {}
+_clients = {}
+# One entry per GC generation, created up front: the GC callback can run in
+# the middle of any allocation (even while _lock is held), so it never takes
+# the lock and never adds or removes keys that a reader may be iterating
+_gc_pauses = {
+    generation: {'collections': 0, 'total_pause_ms': 0.0, 'max_pause_ms': 0.0}
+    for generation in range(len(gc.get_threshold()))
+}
+_gc_started = dict.fromkeys(_gc_pauses)
+_profile = {
+    'active': None,       # running profiler (cProfile.Profile or StackSampler)
+    'mode': None,
+    'remaining': 0,
+    'invocations': 0,
+    'last_result': None
+}
+
+
+def mark_initialized():
+    """Call at the end of the handler module's import to record init duration"""
+    with _lock:
+        if _state['init_duration_ms'] is None:
+            _state['init_duration_ms'] = round((time.perf_counter() - _imported_perf) * 1000, 1)
+
+
+def record_latency(stage: str, duration_ms: float):
+    """Add one observation to a stage's latency histogram"""
+    with _lock:
+        hist = _histograms.get(stage)
+        if hist is None:
+            hist = _histograms[stage] = {
+                'count': 0,
+                'total_ms': 0.0,
+                'min_ms': None,
+                'max_ms': None,
+                'buckets': [0] * (len(LATENCY_BUCKETS_MS) + 1)
+            }
+        hist['count'] += 1
+        hist['total_ms'] += duration_ms
+        hist['min_ms'] = duration_ms if hist['min_ms'] is None else min(hist['min_ms'], duration_ms)
+        hist['max_ms'] = duration_ms if hist['max_ms'] is None else max(hist['max_ms'], duration_ms)
+
+        index = len(LATENCY_BUCKETS_MS)
+        for i, bound in enumerate(LATENCY_BUCKETS_MS):
+            if duration_ms <= bound:
+                index = i
+                break
+        hist['buckets'][index] += 1
+
+
+@contextmanager
+def timed(stage: str):
+    """Time a block and record it under `stage`"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_latency(stage, (time.perf_counter() - start) * 1000)
+
+
+def register_client(name: str, client):
+    """Track a boto3 client so its connection pool shows up in the report"""
+    with _lock:
+        _clients[name] = client
+
+
+def _gc_callback(phase, info):
+    generation = info.get('generation')
+    if generation not in _gc_started:
+        return
+    if phase == 'start':
+        _gc_started[generation] = time.perf_counter()
+    elif _gc_started[generation] is not None:
+        pause_ms = (time.perf_counter() - _gc_started[generation]) * 1000
+        _gc_started[generation] = None
+        stats = _gc_pauses[generation]
+        stats['collections'] += 1
+        stats['total_pause_ms'] += pause_ms
+        stats['max_pause_ms'] = max(stats['max_pause_ms'], pause_ms)
+
+
+gc.callbacks.append(_gc_callback)
+
+
+class StackSampler:
+    """Samples the stacks of all threads on an interval
+
+    Unlike cProfile this also sees the worker threads the handler fans out to,
+    and it costs nothing while the threads are blocked on I/O.
+    """
+
+    def __init__(self, interval: float = SAMPLE_INTERVAL_SECONDS):
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread:
+            self.thread.join()
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self.stopped.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}")
+                    frame = frame.f_back
+                self.stacks[';'.join(reversed(stack))] += 1
+            self.samples += 1
+
+    def result(self):
+        return {
+            'samples': self.samples,
+            'interval_ms': self.interval * 1000,
+            # Collapsed stacks (flame graph input), most frequent first
+            'top_stacks': [
+                {'stack': stack, 'count': count}
+                for stack, count in self.stacks.most_common(TOP_PROFILE_ENTRIES)
+            ]
+        }
+
+
+def start_profile(invocations: int = 1, mode: str = 'sample'):
+    """Profile the next N invocations of this container"""
+    if mode not in ('sample', 'cprofile'):
+        raise ValueError(f"Unknown profile mode: {mode}")
+    # bool is an int subclass; floats (JSON 1e999 parses to inf) are rejected
+    is_int = isinstance(invocations, int) and not isinstance(invocations, bool)
+    if not is_int or not 1 <= invocations <= MAX_PROFILE_INVOCATIONS:
+        raise ValueError(f"invocations must be an integer from 1 to {MAX_PROFILE_INVOCATIONS}")
+    with _lock:
+        if _profile['active'] is not None:
+            raise ValueError("A profile is already running")
+        _profile['mode'] = mode
+        _profile['remaining'] = invocations
+        _profile['invocations'] = 0
+
+
+def _begin_invocation_profile():
+    with _lock:
+        if _profile['remaining'] <= 0:
+            return
+        profiler = _profile['active']
+        created = profiler is None
+        if created:
+            profiler = cProfile.Profile() if _profile['mode'] == 'cprofile' else StackSampler()
+            _profile['active'] = profiler
+
+    # cProfile only sees the handler thread and is switched on per invocation;
+    # the sampler runs until the last profiled invocation ends
+    if isinstance(profiler, cProfile.Profile):
+        profiler.enable()
+    elif created:
+        profiler.start()
+
+
+def _end_invocation_profile():
+    with _lock:
+        profiler = _profile['active']
+        if profiler is None:
+            return
+        _profile['remaining'] -= 1
+        _profile['invocations'] += 1
+        finished = _profile['remaining'] <= 0
+
+    if isinstance(profiler, cProfile.Profile):
+        profiler.disable()
+    if not finished:
+        return
+
+    if isinstance(profiler, cProfile.Profile):
+        output = io.StringIO()
+        pstats.Stats(profiler, stream=output).sort_stats('cumulative').print_stats(TOP_PROFILE_ENTRIES)
+        result = {'report': output.getvalue()}
+    else:
+        profiler.stop()
+        result = profiler.result()
+
+    with _lock:
+        _profile['active'] = None
+        _profile['last_result'] = {
+            'mode': _profile['mode'],
+            'invocations': _profile['invocations'],
+            'finished_at': time.time(),
+            **result
+        }
+
+
+def _read_rss_kb():
+    """Current resident set size from /proc (Linux only)"""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def _pool_stats(client):
+    """Connection-pool usage of a boto3 client (reads botocore/urllib3 internals)"""
+    stats = {}
+    try:
+        stats['max_pool_connections'] = client.meta.config.max_pool_connections
+        manager = client._endpoint.http_session._manager
+        pools = []
+        for key in manager.pools.keys():
+            pool = manager.pools.get(key)
+            if pool is None:
+                continue
+            pools.append({
+                'host': pool.host,
+                'connections_opened': pool.num_connections,
+                'requests': pool.num_requests,
+                'idle_connections': pool.pool.qsize() if pool.pool else 0,
+                'max_size': pool.pool.maxsize if pool.pool else None
+            })
+        stats['pools'] = pools
+    except Exception as e:
+        stats['error'] = f"Pool stats unavailable: {str(e)}"
+    return stats
+
+
+def _histogram_report(hist):
+    """Summarize a histogram with bucket counts and approximate percentiles"""
+    def percentile(p):
+        target = p * hist['count']
+        seen = 0
+        for i, count in enumerate(hist['buckets']):
+            seen += count
+            if seen >= target:
+                return LATENCY_BUCKETS_MS[i] if i < len(LATENCY_BUCKETS_MS) else hist['max_ms']
+        return hist['max_ms']
+
+    labels = [f"<={bound}ms" for bound in LATENCY_BUCKETS_MS] + [f">{LATENCY_BUCKETS_MS[-1]}ms"]
+    return {
+        'count': hist['count'],
+        'mean_ms': round(hist['total_ms'] / hist['count'], 1),
+        'min_ms': round(hist['min_ms'], 1),
+        'max_ms': round(hist['max_ms'], 1),
+        'p50_ms_upper': percentile(0.5),
+        'p95_ms_upper': percentile(0.95),
+        'p99_ms_upper': percentile(0.99),
+        'buckets': {label: count for label, count in zip(labels, hist['buckets']) if count}
+    }
+
+
+def runtime_diagnostics():
+    """Snapshot of everything collected since the cold start"""
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+
+    with _lock:
+        state = dict(_state)
+        histograms = {stage: _histogram_report(hist) for stage, hist in _histograms.items()}
+        clients = dict(_clients)
+        gc_pauses = {str(gen): dict(stats) for gen, stats in list(_gc_pauses.items())}
+        profile = {
+            'mode': _profile['mode'],
+            'remaining_invocations': _profile['remaining'],
+            'last_result': _profile['last_result']
+        }
+
+    return {
+        'cold_start_at': IMPORTED_AT,
+        'uptime_seconds': round(time.time() - IMPORTED_AT, 1),
+        'init_duration_ms': state['init_duration_ms'],
+        'invocations': state['invocations'],
+        'errors': state['errors'],
+        'last_invocation_at': state['last_invocation_at'],
+        'memory': {
+            'rss_kb': _read_rss_kb(),
+            # ru_maxrss is in KB on Linux
+            'peak_rss_kb': usage.ru_maxrss,
+            'limit_mb': os.environ.get('AWS_LAMBDA_FUNCTION_MEMORY_SIZE')
+        },
+        'gc': {
+            'enabled': gc.isenabled(),
+            'counts': gc.get_count(),
+            'thresholds': gc.get_threshold(),
+            'generations': gc.get_stats(),
+            'pauses': gc_pauses
+        },
+        'threads': threading.active_count(),
+        'connection_pools': {name: _pool_stats(client) for name, client in clients.items()},
+        'latency': histograms,
+        'profile': profile
+    }
+
+
+def handle_diagnostics_request(request: dict):
+    """Handle a {"diagnostics": {...}} invocation"""
+    profile = request.get('profile') if isinstance(request, dict) else None
+    if not isinstance(request, dict) or (profile is not None and not isinstance(profile, dict)):
+        return {
+            'statusCode': 400,
+            'headers': {'Content-Type': 'application/json'},
+            'body': json.dumps({'error': 'Expected {"diagnostics": {"profile": {"invocations": N, "mode": "sample"|"cprofile"}}}'})
+        }
+
+    if profile:
+        try:
+            start_profile(profile.get('invocations', 1), profile.get('mode', 'sample'))
+        except (TypeError, ValueError) as e:
+            return {
+                'statusCode': 400,
+                'headers': {'Content-Type': 'application/json'},
+                'body': json.dumps({'error': str(e)})
+            }
+
+    return {
+        'statusCode': 200,
+        'headers': {'Content-Type': 'application/json'},
+        'body': json.dumps(runtime_diagnostics(), indent=2, default=str)
+    }
+
+
+def instrument(handler_fn):
+    """Decorator for Lambda handlers: counts invocations, times them, runs
+    pending profiles and answers {"diagnostics": {...}} invocations."""
+
+    @wraps(handler_fn)
+    def wrapper(event, context):
+        if isinstance(event, dict) and 'diagnostics' in event:
+            return handle_diagnostics_request(event.get('diagnostics') or {})
+
+        with _lock:
+            _state['invocations'] += 1
+            _state['last_invocation_at'] = time.time()
+
+        _begin_invocation_profile()
+        start = time.perf_counter()
+        try:
+            response = handler_fn(event, context)
+            if isinstance(response, dict) and response.get('statusCode', 200) >= 500:
+                with _lock:
+                    _state['errors'] += 1
+            return response
+        except Exception:
+            with _lock:
+                _state['errors'] += 1
+            raise
+        finally:
+            record_latency('handler', (time.perf_counter() - start) * 1000)
+            try:
+                _end_invocation_profile()
+            except Exception:
+                print(f"Error finishing profile: {traceback.format_exc()}")
+
+    return wrapper
+
 
 def handler(event, context):
     """Show what the Lambda container looks like"""
@@ -34,9 +447,10 @@ def handler(event, context):
         },
         "file_system": {
             "writable_tmp": "/tmp exists" if os.path.exists('/tmp') else "/tmp missing",
-            "task_dir": os.listdir('/var/task')[:10],  # Your code location
+            "task_dir": os.listdir('/var/task')[:10] if os.path.exists('/var/task') else [],  # Your code location
             "runtime_dir": os.listdir('/var/runtime')[:10] if os.path.exists('/var/runtime') else [],
         },
+        "runtime_diagnostics": runtime_diagnostics(),
         "this_is_a_container": True,
         "you_just_dont_manage_it": "That's what 'serverless' means!"
     }
@@ -44,5 +458,5 @@ def handler(event, context):
     return {
         'statusCode': 200,
         'headers': {'Content-Type': 'application/json'},
-        'body': json.dumps(container_info, indent=2)
+        'body': json.dumps(container_info, indent=2, default=str)
     }
@@ -1,38 +1,78 @@
+# Imported first so the measured init duration covers the rest of the cold start
+from check_container import instrument, mark_initialized, register_client, timed
+
 import json
+import math
 import os
 import boto3
+from botocore.config import Config
 from concurrent.futures import ThreadPoolExecutor, as_completed
 import traceback
 
+from jobs import create_job_queue, create_result_store, new_job_id
+from retrieval import SHARD_TIMEOUT_SECONDS, federated_retrieve, knowledge_base_ids
+
+MODEL_TIMEOUT_SECONDS = 50
+
+# One or more knowledge bases (shards) - KNOWLEDGE_BASE_IDS, else KNOWLEDGE_BASE_ID
+KNOWLEDGE_BASE_IDS = knowledge_base_ids()
+if not KNOWLEDGE_BASE_IDS:
+    # Fail the cold start, as a missing os.environ['KNOWLEDGE_BASE_ID'] did
+    raise KeyError('KNOWLEDGE_BASE_IDS or KNOWLEDGE_BASE_ID must be set')
+
 # Initialize clients
-bedrock_runtime = boto3.client('bedrock-runtime', region_name=os.environ['REGION'])
-bedrock_agent_runtime = boto3.client('bedrock-agent-runtime', region_name=os.environ['REGION'])
+# The read timeout makes a hung generation actually end instead of holding a thread
+bedrock_runtime = boto3.client(
+    'bedrock-runtime',
+    region_name=os.environ['REGION'],
+    config=Config(
+        connect_timeout=5,
+        read_timeout=MODEL_TIMEOUT_SECONDS,
+        retries={'max_attempts': 2, 'mode': 'standard'}
+    )
+)
+
+# With several knowledge bases, retrieval calls end at the shard timeout so
+# abandoned shard queries free their thread. A single knowledge base is called
+# directly with the default client settings.
+if len(KNOWLEDGE_BASE_IDS) > 1:
+    bedrock_agent_runtime = boto3.client(
+        'bedrock-agent-runtime',
+        region_name=os.environ['REGION'],
+        config=Config(
+            connect_timeout=min(2, SHARD_TIMEOUT_SECONDS),
+            read_timeout=SHARD_TIMEOUT_SECONDS,
+            retries={'max_attempts': 1, 'mode': 'standard'}
+        )
+    )
+else:
+    bedrock_agent_runtime = boto3.client('bedrock-agent-runtime', region_name=os.environ['REGION'])
+
+register_client('bedrock-runtime', bedrock_runtime)
+register_client('bedrock-agent-runtime', bedrock_agent_runtime)
+
+# Async job mode: queue + result store (SQS/DynamoDB in AWS, in-process locally)
+result_store = create_result_store()
+job_queue = create_job_queue()
+
+# Long-poll requests must return before the API Gateway integration timeout (29s)
+MAX_LONG_POLL_SECONDS = 25
 
-KNOWLEDGE_BASE_ID = os.environ['KNOWLEDGE_BASE_ID']
+# Matches maxReceiveCount on the queue's redrive policy; the last delivery
+# marks a failing job 'error' before it is dead-lettered
+JOBS_MAX_RECEIVE_COUNT = int(os.environ.get('JOBS_MAX_RECEIVE_COUNT', '1'))
 
 def retrieve_from_knowledge_base(query: str, max_results: int = 5):
-    """Query the Bedrock Knowledge Base for relevant context"""
-    try:
-        response = bedrock_agent_runtime.retrieve(
-            knowledgeBaseId=KNOWLEDGE_BASE_ID,
-            retrievalQuery={
-                'text': query
-            },
-            retrievalConfiguration={
-                'vectorSearchConfiguration': {
-                    'numberOfResults': max_results
-                }
-            }
-        )
+    """Query the Bedrock Knowledge Base(s) for relevant context
 
-        # Extract and format the retrieved chunks
-        contexts = []
-        for result in response.get('retrievalResults', []):
-            content = result.get('content', {}).get('text', '')
-            if content:
-                contexts.append(content)
+    With several knowledge bases configured, they are queried concurrently and
+    merged into one top-K list (see retrieval.py).
+    """
+    try:
+        results = federated_retrieve(bedrock_agent_runtime, query, max_results, KNOWLEDGE_BASE_IDS)
 
-        return contexts
+        # Extract the retrieved chunks, best first
+        return [result['text'] for result in results]
     except Exception as e:
         print(f"Error retrieving from knowledge base: {str(e)}")
         return []
@@ -167,9 +207,214 @@ Answer based on the context provided. If the context doesn't contain enough info
             'status': 'error'
         }
 
+MODEL_QUERIES = {
+    'claude': query_claude,
+    'llama': query_llama,
+    'titan': query_titan
+}
+
+def get_context_text(question: str):
+    """Retrieve context chunks and join them into the prompt context"""
+    print(f"Retrieving context for question: {question}")
+    with timed('retrieve'):
+        contexts = retrieve_from_knowledge_base(question)
+    context_text = "\n\n".join(contexts) if contexts else "No relevant context found in the knowledge base."
+
+    print(f"Retrieved {len(contexts)} context chunks")
+    return contexts, context_text
+
+def timed_query(name: str, query, question: str, context_text: str):
+    """Run one model query, recording its latency as the 'model:<name>' stage"""
+    with timed(f'model:{name}'):
+        return query(question, context_text)
+
+def query_all_models(question: str, context_text: str, on_result=None):
+    """Query all three LLMs in parallel
+
+    on_result(name, result) is called as each model finishes, so callers can
+    publish partial results. Returns the results in MODEL_QUERIES order.
+    """
+    results = {}
+    # Not a `with` block: its exit would wait for every thread, so a slow model
+    # could run past MODEL_TIMEOUT_SECONDS
+    executor = ThreadPoolExecutor(max_workers=len(MODEL_QUERIES))
+    with timed('fan_out'):
+        futures = {
+            executor.submit(timed_query, name, query, question, context_text): name
+            for name, query in MODEL_QUERIES.items()
+        }
+
+        try:
+            for future in as_completed(futures, timeout=MODEL_TIMEOUT_SECONDS):
+                name = futures[future]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    print(f"Error getting result from {name}: {str(e)}")
+                    result = {
+                        'model': name,
+                        'answer': f'Error: {str(e)}',
+                        'status': 'error'
+                    }
+                results[name] = result
+                if on_result:
+                    on_result(name, result)
+        except Exception as e:
+            # Timed out waiting - report whichever models haven't answered
+            print(f"Error getting results: {str(e)}")
+            for name in MODEL_QUERIES:
+                if name not in results:
+                    results[name] = {
+                        'model': name,
+                        'answer': f'Error: {str(e) or "Timed out"}',
+                        'status': 'error'
+                    }
+                    if on_result:
+                        on_result(name, results[name])
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    return [results[name] for name in MODEL_QUERIES]
+
+def process_job(job_id: str, final_attempt: bool = True):
+    """Worker: run retrieval and fan-out for a queued job, writing results as they arrive
+
+    A failure is re-raised. On the final attempt the job is marked 'error'
+    first; otherwise it goes back to 'pending' so the redelivery can claim it.
+    """
+    # SQS can deliver a message more than once - only one worker runs a job
+    if not result_store.claim(job_id):
+        print(f"Skipping job {job_id}: not found, finished or already running")
+        return
+
+    job = result_store.get(job_id)
+    try:
+        contexts, context_text = get_context_text(job['question'])
+        result_store.update(job_id, contexts_found=len(contexts))
+
+        query_all_models(
+            job['question'],
+            context_text,
+            on_result=lambda name, result: result_store.put_response(job_id, name, result)
+        )
+
+        result_store.update(job_id, status='complete')
+        print(f"Completed job: {job_id}")
+    except Exception as e:
+        print(f"Error processing job {job_id}: {str(e)}")
+        print(traceback.format_exc())
+        if final_attempt:
+            result_store.update(job_id, status='error', error=str(e))
+        else:
+            result_store.update(job_id, status='pending')
+        raise
+
+job_queue.start(process_job)
+
+def submit_job(question: str):
+    """Store a pending job, enqueue it and return its ID immediately"""
+    job_id = new_job_id()
+    result_store.create(job_id, question)
+    job_queue.send(job_id)
+    print(f"Submitted job: {job_id}")
+
+    return {
+        'statusCode': 202,
+        'headers': {
+            'Content-Type': 'application/json',
+            'Access-Control-Allow-Origin': '*'
+        },
+        'body': json.dumps({
+            'jobId': job_id,
+            'status': 'pending'
+        })
+    }
+
+def get_job(event, context):
+    """Return a job's partial or final results
+
+    Query parameters:
+    - wait: seconds to long-poll for a change (default 0 = plain poll)
+    - since: the last version the client saw
+    """
+    job_id = event['pathParameters']['id']
+    params = event.get('queryStringParameters') or {}
+
+    try:
+        wait = float(params.get('wait', 0))
+        since = int(params.get('since', -1))
+        if not math.isfinite(wait) or wait < 0:
+            raise ValueError
+    except ValueError:
+        return {
+            'statusCode': 400,
+            'headers': {
+                'Content-Type': 'application/json',
+                'Access-Control-Allow-Origin': '*'
+            },
+            'body': json.dumps({'error': 'wait must be a non-negative number of seconds and since an integer'})
+        }
+
+    wait = min(wait, MAX_LONG_POLL_SECONDS)
+    if context is not None:
+        # Leave a second to build the response
+        wait = min(wait, context.get_remaining_time_in_millis() / 1000 - 1)
+
+    if wait > 0:
+        job = result_store.wait(job_id, since, wait)
+    else:
+        job = result_store.get(job_id)
+
+    if job is None:
+        return {
+            'statusCode': 404,
+            'headers': {
+                'Content-Type': 'application/json',
+                'Access-Control-Allow-Origin': '*'
+            },
+            'body': json.dumps({'error': 'Job not found'})
+        }
+
+    return {
+        'statusCode': 200,
+        'headers': {
+            'Content-Type': 'application/json',
+            'Access-Control-Allow-Origin': '*'
+        },
+        'body': json.dumps(job)
+    }
+
+def process_queue_records(event):
+    """Worker entry point: SQS delivers one or more queued job IDs
+
+    Failed messages are returned in batchItemFailures so SQS redelivers them,
+    and dead-letters them after JOBS_MAX_RECEIVE_COUNT attempts.
+    """
+    failures = []
+    for record in event['Records']:
+        try:
+            job_id = json.loads(record['body'])['jobId']
+            receive_count = int(record.get('attributes', {}).get('ApproximateReceiveCount', '1'))
+            process_job(job_id, final_attempt=receive_count >= JOBS_MAX_RECEIVE_COUNT)
+        except Exception as e:
+            print(f"Failed SQS message {record['messageId']}: {str(e)}")
+            failures.append({'itemIdentifier': record['messageId']})
+
+    return {'batchItemFailures': failures}
+
+@instrument
 def handler(event, context):
     """Lambda handler for chat requests"""
+    # Queued jobs delivered by SQS - failures are reported back to SQS, not
+    # turned into an HTTP error response
+    if 'Records' in event:
+        return process_queue_records(event)
+
     try:
+        # Poll for an async job's results
+        if event.get('httpMethod') == 'GET':
+            return get_job(event, context)
+
         # Parse request body
         body = json.loads(event['body'])
         question = body.get('question', '').strip()
@@ -184,39 +429,12 @@ def handler(event, context):
                 'body': json.dumps({'error': 'Question is required'})
             }
 
-        # Retrieve context from knowledge base
-        print(f"Retrieving context for question: {question}")
-        contexts = retrieve_from_knowledge_base(question)
-        context_text = "\n\n".join(contexts) if contexts else "No relevant context found in the knowledge base."
-
-        print(f"Retrieved {len(contexts)} context chunks")
-
-        # Query all three LLMs in parallel
-        results = []
-        with ThreadPoolExecutor(max_workers=3) as executor:
-            # Submit all three queries
-            future_claude = executor.submit(query_claude, question, context_text)
-            future_llama = executor.submit(query_llama, question, context_text)
-            future_titan = executor.submit(query_titan, question, context_text)
-
-            # Collect results as they complete
-            futures = {
-                'claude': future_claude,
-                'llama': future_llama,
-                'titan': future_titan
-            }
+        # Async mode: return a job ID now, answer in the background
+        if body.get('async'):
+            return submit_job(question)
 
-            for name, future in futures.items():
-                try:
-                    result = future.result(timeout=50)
-                    results.append(result)
-                except Exception as e:
-                    print(f"Error getting result from {name}: {str(e)}")
-                    results.append({
-                        'model': name,
-                        'answer': f'Error: {str(e)}',
-                        'status': 'error'
-                    })
+        contexts, context_text = get_context_text(question)
+        results = query_all_models(question, context_text)
 
         return {
             'statusCode': 200,
@@ -242,3 +460,5 @@ def handler(event, context):
             },
             'body': json.dumps({'error': str(e)})
         }
+
+mark_initialized()
@@ -0,0 +1,243 @@
+"""
+Job queue and result store for asynchronous chat requests
+
+Submitting a job stores a 'pending' record and enqueues the job ID. A worker
+picks it up, writes each model's answer to the store as soon as it arrives,
+and finally marks the job 'complete'. Clients poll (or long-poll) the store.
+
+In AWS the queue is SQS (JOBS_QUEUE_URL) and the store is DynamoDB
+(JOBS_TABLE). When those aren't set - e.g. when running local_test.py - the
+in-process stand-ins below are used instead: a thread-backed queue and an
+in-memory store.
+"""
+
+import json
+import os
+import queue
+import threading
+import time
+import uuid
+
+import boto3
+
+JOBS_TABLE = os.environ.get('JOBS_TABLE')
+JOBS_QUEUE_URL = os.environ.get('JOBS_QUEUE_URL')
+
+# Finished jobs are expired by DynamoDB TTL after this long
+JOB_TTL_SECONDS = 24 * 60 * 60
+
+# How often the DynamoDB store is re-read while long-polling
+POLL_INTERVAL_SECONDS = 0.5
+
+# A 'running' job whose worker hasn't finished within this long (longer than
+# the Lambda timeout) is assumed dead and may be claimed again on redelivery
+JOB_CLAIM_TIMEOUT_SECONDS = int(os.environ.get('JOB_CLAIM_TIMEOUT_SECONDS', '90'))
+
+FINAL_STATUSES = ('complete', 'error')
+
+
+def new_job_id():
+    return uuid.uuid4().hex
+
+
+def new_job(job_id: str, question: str):
+    """The record stored when a job is submitted"""
+    now = int(time.time())
+    return {
+        'jobId': job_id,
+        'question': question,
+        'status': 'pending',
+        'contexts_found': 0,
+        'responses': {},
+        'version': 0,
+        'createdAt': now,
+        'ttl': now + JOB_TTL_SECONDS
+    }
+
+
+class LocalResultStore:
+    """In-memory result store - stand-in for DynamoDB"""
+
+    def __init__(self):
+        self.jobs = {}
+        self.changed = threading.Condition()
+
+    def create(self, job_id: str, question: str):
+        with self.changed:
+            self.jobs[job_id] = new_job(job_id, question)
+            self.changed.notify_all()
+
+    def get(self, job_id: str):
+        with self.changed:
+            job = self.jobs.get(job_id)
+            return json.loads(json.dumps(job)) if job else None
+
+    def claim(self, job_id: str):
+        """Move a job to 'running' for this worker; False if it's finished or already being worked on"""
+        now = int(time.time())
+        with self.changed:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return False
+            stale = job['status'] == 'running' and job.get('claimedAt', 0) <= now - JOB_CLAIM_TIMEOUT_SECONDS
+            if job['status'] != 'pending' and not stale:
+                return False
+            job['status'] = 'running'
+            job['claimedAt'] = now
+            job['version'] += 1
+            self.changed.notify_all()
+            return True
+
+    def update(self, job_id: str, **fields):
+        """Set top-level fields (status, contexts_found, error)"""
+        with self.changed:
+            job = self.jobs[job_id]
+            job.update(fields)
+            job['version'] += 1
+            self.changed.notify_all()
+
+    def put_response(self, job_id: str, key: str, result: dict):
+        """Record one model's answer as a partial result"""
+        with self.changed:
+            job = self.jobs[job_id]
+            job['responses'][key] = result
+            job['version'] += 1
+            self.changed.notify_all()
+
+    def wait(self, job_id: str, since_version: int, timeout: float):
+        """Block until the job changes past since_version, finishes, or timeout elapses"""
+        deadline = time.monotonic() + timeout
+        with self.changed:
+            while True:
+                job = self.jobs.get(job_id)
+                if job is None or job['version'] > since_version or job['status'] in FINAL_STATUSES:
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self.changed.wait(remaining)
+        return self.get(job_id)
+
+
+class DynamoDBResultStore:
+    """Result store backed by a DynamoDB table keyed on jobId"""
+
+    def __init__(self, table_name: str):
+        self.table = boto3.resource('dynamodb', region_name=os.environ['REGION']).Table(table_name)
+
+    def create(self, job_id: str, question: str):
+        self.table.put_item(Item=new_job(job_id, question))
+
+    def get(self, job_id: str):
+        item = self.table.get_item(Key={'jobId': job_id}, ConsistentRead=True).get('Item')
+        # DynamoDB returns numbers as Decimal
+        return json.loads(json.dumps(item, default=int)) if item else None
+
+    def claim(self, job_id: str):
+        # Conditional update so duplicate SQS deliveries don't rerun a job
+        now = int(time.time())
+        try:
+            self.table.update_item(
+                Key={'jobId': job_id},
+                UpdateExpression='SET #s = :running, claimedAt = :now ADD version :one',
+                ConditionExpression='#s = :pending OR (#s = :running AND claimedAt <= :stale)',
+                ExpressionAttributeNames={'#s': 'status'},
+                ExpressionAttributeValues={
+                    ':running': 'running',
+                    ':pending': 'pending',
+                    ':now': now,
+                    ':stale': now - JOB_CLAIM_TIMEOUT_SECONDS,
+                    ':one': 1
+                }
+            )
+            return True
+        except self.table.meta.client.exceptions.ConditionalCheckFailedException:
+            return False
+
+    def update(self, job_id: str, **fields):
+        names = {f'#f{i}': name for i, name in enumerate(fields)}
+        values = {f':v{i}': value for i, value in enumerate(fields.values())}
+        assignments = ', '.join(f'#f{i} = :v{i}' for i in range(len(fields)))
+        self.table.update_item(
+            Key={'jobId': job_id},
+            UpdateExpression=f'SET {assignments} ADD version :one',
+            ExpressionAttributeNames=names,
+            ExpressionAttributeValues={**values, ':one': 1}
+        )
+
+    def put_response(self, job_id: str, key: str, result: dict):
+        self.table.update_item(
+            Key={'jobId': job_id},
+            UpdateExpression='SET responses.#k = :r ADD version :one',
+            ExpressionAttributeNames={'#k': key},
+            ExpressionAttributeValues={':r': result, ':one': 1}
+        )
+
+    def wait(self, job_id: str, since_version: int, timeout: float):
+        deadline = time.monotonic() + timeout
+        while True:
+            job = self.get(job_id)
+            if job is None or job['version'] > since_version or job['status'] in FINAL_STATUSES:
+                return job
+            if time.monotonic() + POLL_INTERVAL_SECONDS > deadline:
+                return job
+            time.sleep(POLL_INTERVAL_SECONDS)
+
+
+class LocalJobQueue:
+    """In-process queue with a background worker thread - stand-in for SQS"""
+
+    def __init__(self):
+        self.queue = queue.Queue()
+        self.worker = None
+        self.process = None
+
+    def start(self, process):
+        """Register the function that runs a job; it is called with the job ID"""
+        self.process = process
+
+    def send(self, job_id: str):
+        self.queue.put(job_id)
+        if self.worker is None or not self.worker.is_alive():
+            self.worker = threading.Thread(target=self._run, daemon=True)
+            self.worker.start()
+
+    def _run(self):
+        while True:
+            try:
+                job_id = self.queue.get(timeout=1)
+            except queue.Empty:
+                return
+            try:
+                self.process(job_id)
+            except Exception as e:
+                # Already recorded on the job - keep the worker alive
+                print(f"Job {job_id} failed: {str(e)}")
+            finally:
+                self.queue.task_done()
+
+
+class SQSJobQueue:
+    """SQS queue - jobs are delivered back to the chat Lambda by an event source mapping"""
+
+    def __init__(self, queue_url: str):
+        self.queue_url = queue_url
+        self.sqs = boto3.client('sqs', region_name=os.environ['REGION'])
+
+    def start(self, process):
+        # Nothing to do - the Lambda runtime delivers SQS records to the handler
+        pass
+
+    def send(self, job_id: str):
+        self.sqs.send_message(
+            QueueUrl=self.queue_url,
+            MessageBody=json.dumps({'jobId': job_id})
+        )
+
+
+def create_result_store():
+    return DynamoDBResultStore(JOBS_TABLE) if JOBS_TABLE else LocalResultStore()
+
+
+def create_job_queue():
+    return SQSJobQueue(JOBS_QUEUE_URL) if JOBS_QUEUE_URL else LocalJobQueue()
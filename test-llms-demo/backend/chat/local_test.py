@@ -6,15 +6,22 @@ Run this to test your Lambda locally with VS Code debugger
 import json
 import os
 import sys
+import time
 
 # Set up environment variables (use your actual values)
 os.environ['REGION'] = 'us-east-1'
 os.environ['KNOWLEDGE_BASE_ID'] = 'CJBBYSINRN'  # From your terraform output
 os.environ['AWS_PROFILE'] = 'default'  # Or your AWS profile name
 
+# JOBS_TABLE / JOBS_QUEUE_URL are left unset so async jobs use the
+# in-process queue and result store
+
 # Import the Lambda handler
 from index import handler
 
+# Stop polling an async job after this long, even if it never finishes
+MAX_POLL_SECONDS = 120
+
 # Mock Lambda context
 class MockContext:
     def __init__(self):
@@ -72,8 +79,59 @@ def test_lambda_locally():
     return response
 
 
+def test_async_job_locally():
+    """Submit an async job, then long-poll until every model has answered"""
+
+    event = {
+        'body': json.dumps({
+            'question': 'What is AWS Lambda?',
+            'async': True
+        }),
+        'httpMethod': 'POST',
+        'path': '/chat'
+    }
+
+    context = MockContext()
+
+    print("=" * 80)
+    print("LOCAL ASYNC JOB TEST")
+    print("=" * 80)
+
+    response = handler(event, context)
+    job_id = json.loads(response['body'])['jobId']
+    print(f"Submitted job: {job_id} (status {response['statusCode']})")
+
+    version = -1
+    started = time.time()
+    while time.time() - started < MAX_POLL_SECONDS:
+        poll_event = {
+            'httpMethod': 'GET',
+            'path': f'/chat/{job_id}',
+            'pathParameters': {'id': job_id},
+            'queryStringParameters': {'wait': '20', 'since': str(version)}
+        }
+        job = json.loads(handler(poll_event, context)['body'])
+        version = job['version']
+        print(f"[{time.time() - started:5.1f}s] status={job['status']} "
+              f"responses={sorted(job['responses'])}")
+
+        if job['status'] in ('complete', 'error'):
+            break
+    else:
+        print(f"Gave up after {MAX_POLL_SECONDS}s - job still {job['status']}")
+
+    print(json.dumps(job, indent=2))
+    print("=" * 80)
+
+    return job
+
+
 if __name__ == '__main__':
     # You can set a breakpoint here or inside the handler
+    if '--async' in sys.argv:
+        job = test_async_job_locally()
+        sys.exit(0 if job['status'] == 'complete' else 1)
+
     result = test_lambda_locally()
 
     # Check if successful
@@ -0,0 +1,184 @@
+"""
+Federated retrieval across multiple Bedrock Knowledge Bases
+
+Each knowledge base (shard) is queried concurrently and the results are
+merged into one global top-K. How they are merged is set by RETRIEVAL_MERGE:
+- 'score' (default): when every shard uses the same embedding model and
+  similarity metric, raw scores are on one scale and are merged as-is.
+  Rescaling each shard (e.g. min-max) would give a weak shard's best hit the
+  same score as a strong shard's best.
+- 'rrf': when shards use different embedding models, their scores can't be
+  compared, so results are fused by rank instead (reciprocal rank fusion).
+
+With a single knowledge base there is nothing to federate: it is called
+directly, with no shard timeout. With several, slow shards don't hold up the
+request:
+- every shard has a hard timeout (SHARD_TIMEOUT_SECONDS)
+- after EARLY_TERMINATION_SECONDS, if the shards that already answered have
+  returned at least top-K results, the stragglers are dropped
+
+Configure the shards with KNOWLEDGE_BASE_IDS (comma separated); it falls back
+to the single KNOWLEDGE_BASE_ID.
+"""
+
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from check_container import timed
+
+SHARD_TIMEOUT_SECONDS = float(os.environ.get('SHARD_TIMEOUT_SECONDS', '5'))
+EARLY_TERMINATION_SECONDS = float(os.environ.get('EARLY_TERMINATION_SECONDS', '1.5'))
+
+MERGE_STRATEGIES = ('score', 'rrf')
+MERGE_STRATEGY = os.environ.get('RETRIEVAL_MERGE', 'score')
+if MERGE_STRATEGY not in MERGE_STRATEGIES:
+    raise ValueError(f"RETRIEVAL_MERGE must be one of {MERGE_STRATEGIES}, got {MERGE_STRATEGY!r}")
+
+# Standard RRF constant - damps the weight of the top few ranks
+RRF_K = 60
+
+# Shared across warm invocations. An abandoned shard query keeps its thread
+# until the client's read timeout ends it, so the response doesn't wait on it
+_executor = ThreadPoolExecutor(max_workers=int(os.environ.get('MAX_SHARD_WORKERS', '8')))
+
+
+def knowledge_base_ids():
+    """The configured shards, in order, without duplicates"""
+    ids = os.environ.get('KNOWLEDGE_BASE_IDS') or os.environ.get('KNOWLEDGE_BASE_ID', '')
+    return list(dict.fromkeys(kb_id.strip() for kb_id in ids.split(',') if kb_id.strip()))
+
+
+def query_shard(client, knowledge_base_id: str, query: str, max_results: int):
+    """Retrieve from one knowledge base, returning results with raw scores"""
+    with timed(f'retrieve:{knowledge_base_id}'):
+        response = client.retrieve(
+            knowledgeBaseId=knowledge_base_id,
+            retrievalQuery={
+                'text': query
+            },
+            retrievalConfiguration={
+                'vectorSearchConfiguration': {
+                    'numberOfResults': max_results
+                }
+            }
+        )
+
+    results = []
+    for result in response.get('retrievalResults', []):
+        content = result.get('content', {}).get('text', '')
+        if content:
+            results.append({
+                'text': content,
+                'score': result.get('score', 0.0),
+                'knowledge_base_id': knowledge_base_id,
+                'location': result.get('location')
+            })
+    return results
+
+
+def merge_results(shard_results, max_results: int):
+    """Merge shard results into a global top-K by raw score, dropping duplicate chunks"""
+    merged = []
+    for results in shard_results:
+        merged.extend(results)
+
+    merged.sort(key=lambda r: r['score'], reverse=True)
+
+    top = []
+    seen = set()
+    for r in merged:
+        if r['text'] in seen:
+            continue
+        seen.add(r['text'])
+        top.append(r)
+        if len(top) == max_results:
+            break
+    return top
+
+
+def fuse_results_rrf(shard_results, max_results: int, k: int = RRF_K):
+    """Merge shard results into a global top-K by reciprocal rank fusion
+
+    Only each result's rank within its shard counts, so shards with
+    incomparable scores can be mixed. A chunk returned by several shards
+    sums its contributions.
+    """
+    fused = {}
+    for results in shard_results:
+        ranked = sorted(results, key=lambda r: r['score'], reverse=True)
+        for rank, r in enumerate(ranked, start=1):
+            entry = fused.get(r['text'])
+            if entry is None:
+                entry = fused[r['text']] = {**r, 'rrf_score': 0.0}
+            entry['rrf_score'] += 1.0 / (k + rank)
+
+    return sorted(fused.values(), key=lambda r: r['rrf_score'], reverse=True)[:max_results]
+
+
+def federated_retrieve(client, query: str, max_results: int = 5, kb_ids=None):
+    """Query every shard concurrently and merge the results into one top-K list
+
+    A shard's timeout counts from when its call starts, not from when it was
+    queued on the executor. The client should have a botocore read timeout of
+    SHARD_TIMEOUT_SECONDS so abandoned calls end and
+    free their worker thread.
+    """
+    kb_ids = kb_ids or knowledge_base_ids()
+    if len(kb_ids) == 1:
+        return query_shard(client, kb_ids[0], query, max_results)
+
+    start = time.monotonic()
+    started = {}
+
+    def run_shard(kb_id):
+        started[kb_id] = time.monotonic()
+        return query_shard(client, kb_id, query, max_results)
+
+    futures = {_executor.submit(run_shard, kb_id): kb_id for kb_id in kb_ids}
+
+    shard_results = []
+    collected = 0
+    pending = set(futures)
+    while pending:
+        now = time.monotonic()
+        if now - start >= EARLY_TERMINATION_SECONDS and collected >= max_results:
+            break
+
+        # Drop shards that have been running longer than their timeout
+        timed_out = {
+            f for f in pending
+            if futures[f] in started and now - started[futures[f]] >= SHARD_TIMEOUT_SECONDS
+        }
+        for future in timed_out:
+            print(f"Knowledge base {futures[future]} timed out after {SHARD_TIMEOUT_SECONDS}s")
+        pending -= timed_out
+        if not pending:
+            break
+
+        # Wake up at the next shard deadline or the early-termination point;
+        # poll briefly while some shards are still queued
+        wake_at = [started[futures[f]] + SHARD_TIMEOUT_SECONDS for f in pending if futures[f] in started]
+        if now - start < EARLY_TERMINATION_SECONDS:
+            wake_at.append(start + EARLY_TERMINATION_SECONDS)
+        if len(wake_at) < len(pending):
+            wake_at.append(now + 0.05)
+        done, pending = wait(pending, timeout=max(min(wake_at) - now, 0), return_when=FIRST_COMPLETED)
+
+        for future in done:
+            kb_id = futures[future]
+            try:
+                results = future.result()
+                shard_results.append(results)
+                collected += len(results)
+            except Exception as e:
+                print(f"Error retrieving from knowledge base {kb_id}: {str(e)}")
+
+    for future in pending:
+        future.cancel()
+        print(f"Skipped slow knowledge base {futures[future]} after {time.monotonic() - start:.2f}s")
+
+    if MERGE_STRATEGY == 'rrf':
+        return fuse_results_rrf(shard_results, max_results)
+    return merge_results(shard_results, max_results)
+
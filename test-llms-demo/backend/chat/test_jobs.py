@@ -0,0 +1,104 @@
+"""
+Tests for claiming and long-polling async chat jobs
+Run with: python -m unittest test_jobs
+"""
+
+import threading
+import time
+import unittest
+from unittest import mock
+
+import jobs
+from jobs import LocalResultStore
+
+
+class ClaimTest(unittest.TestCase):
+
+    def setUp(self):
+        self.store = LocalResultStore()
+        self.store.create('job', 'What is AWS Lambda?')
+
+    def test_claims_pending_job(self):
+        self.assertTrue(self.store.claim('job'))
+
+        job = self.store.get('job')
+        self.assertEqual(job['status'], 'running')
+        self.assertEqual(job['version'], 1)
+
+    def test_rejects_duplicate_claim(self):
+        self.assertTrue(self.store.claim('job'))
+        self.assertFalse(self.store.claim('job'))
+
+    def test_rejects_finished_job(self):
+        self.store.update('job', status='complete')
+
+        self.assertFalse(self.store.claim('job'))
+
+    def test_rejects_missing_job(self):
+        self.assertFalse(self.store.claim('nope'))
+
+    def test_reclaims_stale_running_job(self):
+        self.assertTrue(self.store.claim('job'))
+        self.store.jobs['job']['claimedAt'] -= jobs.JOB_CLAIM_TIMEOUT_SECONDS
+
+        self.assertTrue(self.store.claim('job'))
+        self.assertEqual(self.store.get('job')['version'], 2)
+
+    def test_claim_timeout_is_configurable(self):
+        self.assertTrue(self.store.claim('job'))
+
+        with mock.patch.object(jobs, 'JOB_CLAIM_TIMEOUT_SECONDS', 0):
+            self.assertTrue(self.store.claim('job'))
+
+
+class WaitTest(unittest.TestCase):
+
+    def setUp(self):
+        self.store = LocalResultStore()
+        self.store.create('job', 'What is AWS Lambda?')
+
+    def update_later(self, **fields):
+        timer = threading.Timer(0.05, self.store.update, args=('job',), kwargs=fields)
+        timer.start()
+        self.addCleanup(timer.join)
+
+    def test_returns_on_version_bump(self):
+        self.update_later(contexts_found=3)
+
+        start = time.monotonic()
+        job = self.store.wait('job', since_version=0, timeout=5)
+
+        self.assertLess(time.monotonic() - start, 1)
+        self.assertEqual(job['version'], 1)
+        self.assertEqual(job['contexts_found'], 3)
+
+    def test_returns_immediately_when_already_newer(self):
+        self.store.update('job', contexts_found=3)
+
+        start = time.monotonic()
+        job = self.store.wait('job', since_version=0, timeout=5)
+
+        self.assertLess(time.monotonic() - start, 1)
+        self.assertEqual(job['version'], 1)
+
+    def test_returns_on_final_status(self):
+        self.store.update('job', status='error', error='boom')
+
+        # Even when the caller already has the latest version
+        start = time.monotonic()
+        job = self.store.wait('job', since_version=1, timeout=5)
+
+        self.assertLess(time.monotonic() - start, 1)
+        self.assertEqual(job['status'], 'error')
+
+    def test_times_out_without_changes(self):
+        start = time.monotonic()
+        job = self.store.wait('job', since_version=0, timeout=0.1)
+
+        self.assertGreaterEqual(time.monotonic() - start, 0.1)
+        self.assertEqual(job['status'], 'pending')
+        self.assertEqual(job['version'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
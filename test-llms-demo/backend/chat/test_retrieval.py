@@ -0,0 +1,114 @@
+"""
+Tests for merging federated retrieval results
+Run with: python -m unittest test_retrieval
+"""
+
+import time
+import unittest
+from unittest import mock
+
+import retrieval
+from retrieval import federated_retrieve, fuse_results_rrf, merge_results
+
+
+def shard(kb_id, scores):
+    return [
+        {'text': f'{kb_id}{i}', 'score': score, 'knowledge_base_id': kb_id, 'location': None}
+        for i, score in enumerate(scores)
+    ]
+
+
+class MergeResultsTest(unittest.TestCase):
+
+    def test_strong_shard_outranks_weak_shard(self):
+        # A weak shard's best hit must not beat a strong shard's good hits
+        good = shard('good', [0.90, 0.88, 0.87, 0.86, 0.85])
+        bad = shard('bad', [0.30, 0.20, 0.10])
+
+        top = merge_results([good, bad], 5)
+
+        self.assertEqual([r['text'] for r in top], ['good0', 'good1', 'good2', 'good3', 'good4'])
+
+    def test_interleaves_by_raw_score(self):
+        a = shard('a', [0.9, 0.5])
+        b = shard('b', [0.7, 0.6])
+
+        top = merge_results([a, b], 3)
+
+        self.assertEqual([r['text'] for r in top], ['a0', 'b0', 'b1'])
+
+    def test_drops_duplicate_chunks(self):
+        a = [{'text': 'same', 'score': 0.8, 'knowledge_base_id': 'a', 'location': None}]
+        b = [{'text': 'same', 'score': 0.7, 'knowledge_base_id': 'b', 'location': None}]
+
+        top = merge_results([a, b], 5)
+
+        self.assertEqual(len(top), 1)
+        self.assertEqual(top[0]['knowledge_base_id'], 'a')
+
+
+class FuseResultsRRFTest(unittest.TestCase):
+
+    def test_ignores_score_scale(self):
+        # Shards with different embedding models: b's scores are on a
+        # different scale, but each shard's best hit ranks the same
+        a = shard('a', [0.9, 0.8])
+        b = shard('b', [420.0, 310.0])
+
+        top = fuse_results_rrf([a, b], 4)
+
+        self.assertEqual({r['text'] for r in top[:2]}, {'a0', 'b0'})
+        self.assertEqual({r['text'] for r in top[2:]}, {'a1', 'b1'})
+
+    def test_chunk_found_by_several_shards_ranks_first(self):
+        a = [{'text': 'x', 'score': 0.9, 'knowledge_base_id': 'a', 'location': None},
+             {'text': 'same', 'score': 0.5, 'knowledge_base_id': 'a', 'location': None}]
+        b = [{'text': 'y', 'score': 0.9, 'knowledge_base_id': 'b', 'location': None},
+             {'text': 'same', 'score': 0.5, 'knowledge_base_id': 'b', 'location': None}]
+
+        top = fuse_results_rrf([a, b], 5)
+
+        self.assertEqual(top[0]['text'], 'same')
+        self.assertEqual(len(top), 3)
+
+    def test_limits_to_max_results(self):
+        top = fuse_results_rrf([shard('a', [0.9, 0.8, 0.7]), shard('b', [0.6, 0.5])], 2)
+
+        self.assertEqual(len(top), 2)
+
+
+class SlowClient:
+    """Stub bedrock-agent-runtime client that answers after a delay"""
+
+    def __init__(self, delay):
+        self.delay = delay
+
+    def retrieve(self, knowledgeBaseId, **kwargs):
+        time.sleep(self.delay)
+        return {'retrievalResults': [{'content': {'text': f'{knowledgeBaseId}0'}, 'score': 0.5}]}
+
+
+class FederatedRetrieveTest(unittest.TestCase):
+
+    def test_single_knowledge_base_has_no_timeout(self):
+        with mock.patch.object(retrieval, 'SHARD_TIMEOUT_SECONDS', 0.01):
+            top = federated_retrieve(SlowClient(0.05), 'q', 5, ['only'])
+
+        self.assertEqual([r['text'] for r in top], ['only0'])
+
+    def test_slow_shard_is_dropped(self):
+        with mock.patch.object(retrieval, 'SHARD_TIMEOUT_SECONDS', 0.05):
+            top = federated_retrieve(SlowClient(0.2), 'q', 5, ['a', 'b'])
+
+        self.assertEqual(top, [])
+
+    def test_rrf_merge_strategy(self):
+        with mock.patch.object(retrieval, 'MERGE_STRATEGY', 'rrf'):
+            top = federated_retrieve(SlowClient(0), 'q', 5, ['a', 'b'])
+
+        self.assertEqual({r['text'] for r in top}, {'a0', 'b0'})
+        self.assertTrue(all('rrf_score' in r for r in top))
+
+
+if __name__ == '__main__':
+    unittest.main()
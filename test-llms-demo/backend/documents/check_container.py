@@ -0,0 +1 @@
+../chat/check_container.py
\ No newline at end of file
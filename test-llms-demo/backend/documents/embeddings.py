@@ -0,0 +1,348 @@
+"""
+Chunk-level embedding cache and batched embedding precompute job
+
+Documents are split into chunks and every chunk is hashed. The hash is looked
+up in a persistent SQLite cache (kept in S3 between runs), so only chunks that
+have never been seen before are sent to the Titan embedding model. The result
+is written as OpenSearch bulk NDJSON using the same field mapping as the
+Knowledge Base index (embedding / text / metadata).
+
+Scope: this does not change how the Bedrock Knowledge Base syncs. Its
+ingestion jobs already skip unchanged files and only re-embed new or modified
+ones. This job adds chunk-level reuse on top of that, for a self-managed
+vector index:
+- create an index with the same mapping (terraform/scripts/create_opensearch_index.py)
+- POST the output file to that index's _bulk endpoint
+
+VECTORSEARCH collections don't accept custom document IDs, so documents can't
+be upserted. The file holds the whole corpus and is meant for a fresh index.
+Don't load it into the index the Knowledge Base manages.
+
+POST /embeddings starts it asynchronously on its own Lambda (15 minute
+timeout), or run it locally:
+    python embeddings.py
+The cache is uploaded every few batches, so a run that hits the Lambda
+timeout still keeps most of its work for the next run.
+"""
+
+# Imported first so the measured init duration covers the rest of the cold start
+# (check_container.py is a symlink to the chat function's copy)
+from check_container import instrument, mark_initialized, register_client, timed
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import boto3
+
+s3_client = boto3.client('s3')
+bedrock_runtime = boto3.client('bedrock-runtime', region_name=os.environ['REGION'])
+register_client('s3', s3_client)
+register_client('bedrock-runtime', bedrock_runtime)
+
+BUCKET_NAME = os.environ['BUCKET_NAME']
+# Separate bucket so the Knowledge Base data source never ingests the cache/output
+EMBEDDINGS_BUCKET = os.environ['EMBEDDINGS_BUCKET']
+EMBEDDING_MODEL_ID = os.environ.get('EMBEDDING_MODEL_ID', 'amazon.titan-embed-text-v1')
+DATA_SOURCE_ID = os.environ.get('DATA_SOURCE_ID')
+
+# Where the cache and precomputed output live in the embeddings bucket
+CACHE_KEY = os.environ.get('EMBEDDING_CACHE_KEY', 'cache.sqlite3')
+OUTPUT_KEY = os.environ.get('EMBEDDING_OUTPUT_KEY', 'vectors.ndjson')
+CACHE_PATH = os.environ.get('EMBEDDING_CACHE_PATH', '/tmp/embedding_cache.sqlite3')
+
+# Only plain-text documents can be chunked here
+TEXT_EXTENSIONS = ('.txt', '.md', '.csv', '.json', '.html', '.htm')
+
+CHUNK_SIZE = 1000      # characters per chunk
+CHUNK_OVERLAP = 200    # characters shared with the previous chunk
+BATCH_SIZE = 16        # chunks embedded per worker task
+MAX_WORKERS = 4        # concurrent embedding batches
+MAX_REQUESTS_PER_SECOND = 10  # Bedrock InvokeModel rate limit for the job
+CACHE_SAVE_EVERY_BATCHES = 5  # upload the cache to S3 after this many batches
+
+
+def chunk_text(text: str, chunk_size: int = CHUNK_SIZE, overlap: int = CHUNK_OVERLAP):
+    """Split text into overlapping chunks, preferring to break on whitespace"""
+    text = text.strip()
+    if not text:
+        return []
+
+    chunks = []
+    start = 0
+    while start < len(text):
+        end = min(start + chunk_size, len(text))
+        if end < len(text):
+            # Back up to the last whitespace (space, newline, tab...) so words
+            # are not cut in half
+            for split_at in range(end, start + overlap, -1):
+                if text[split_at].isspace():
+                    end = split_at
+                    break
+
+        chunk = text[start:end].strip()
+        if chunk:
+            chunks.append(chunk)
+
+        if end >= len(text):
+            break
+        start = max(end - overlap, start + 1)
+
+    return chunks
+
+
+def chunk_hash(chunk: str, model_id: str = EMBEDDING_MODEL_ID):
+    """Content hash of a chunk - the model ID is included so switching models invalidates the cache"""
+    return hashlib.sha256(f"{model_id}\n{chunk}".encode('utf-8')).hexdigest()
+
+
+class EmbeddingCache:
+    """SQLite cache of chunk hash -> embedding vector"""
+
+    def __init__(self, path: str = CACHE_PATH):
+        self.path = path
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS embeddings ('
+            'hash TEXT PRIMARY KEY, model TEXT NOT NULL, vector TEXT NOT NULL)'
+        )
+        self.lock = threading.Lock()
+
+    def get_many(self, hashes):
+        """Return {hash: vector} for every hash already in the cache"""
+        found = {}
+        hashes = list(hashes)
+        # Stay below SQLite's bound-parameter limit
+        for i in range(0, len(hashes), 500):
+            batch = hashes[i:i + 500]
+            placeholders = ','.join('?' * len(batch))
+            with self.lock:
+                rows = self.conn.execute(
+                    f'SELECT hash, vector FROM embeddings WHERE hash IN ({placeholders})',
+                    batch
+                ).fetchall()
+            for h, vector in rows:
+                found[h] = json.loads(vector)
+        return found
+
+    def put_many(self, items, model_id: str = EMBEDDING_MODEL_ID):
+        """Store {hash: vector} pairs"""
+        with self.lock:
+            self.conn.executemany(
+                'INSERT OR REPLACE INTO embeddings (hash, model, vector) VALUES (?, ?, ?)',
+                [(h, model_id, json.dumps(vector)) for h, vector in items.items()]
+            )
+            self.conn.commit()
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+    @classmethod
+    def load_from_s3(cls, bucket: str = EMBEDDINGS_BUCKET, key: str = CACHE_KEY, path: str = CACHE_PATH):
+        """Download the cache from S3 (if it exists) and open it"""
+        try:
+            s3_client.download_file(bucket, key, path)
+            print(f"Loaded embedding cache from s3://{bucket}/{key}")
+        except Exception as e:
+            print(f"No existing embedding cache, starting empty: {str(e)}")
+        return cls(path)
+
+    def save_to_s3(self, bucket: str = EMBEDDINGS_BUCKET, key: str = CACHE_KEY):
+        """Upload the cache back to S3 so the next run can reuse it"""
+        with self.lock:
+            self.conn.commit()
+        s3_client.upload_file(self.path, bucket, key)
+        print(f"Saved embedding cache to s3://{bucket}/{key}")
+
+
+class RateLimiter:
+    """Simple thread-safe limiter: at most `rate` calls per second across all workers"""
+
+    def __init__(self, rate: float = MAX_REQUESTS_PER_SECOND):
+        self.interval = 1.0 / rate
+        self.next_allowed = time.monotonic()
+        self.lock = threading.Lock()
+
+    def wait(self):
+        with self.lock:
+            now = time.monotonic()
+            wait_for = self.next_allowed - now
+            self.next_allowed = max(now, self.next_allowed) + self.interval
+        if wait_for > 0:
+            time.sleep(wait_for)
+
+
+def embed_text(text: str, rate_limiter: RateLimiter = None, retries: int = 3):
+    """Embed a single chunk with Titan, retrying on throttling"""
+    body = json.dumps({"inputText": text})
+
+    for attempt in range(retries + 1):
+        if rate_limiter:
+            rate_limiter.wait()
+        try:
+            response = bedrock_runtime.invoke_model(
+                modelId=EMBEDDING_MODEL_ID,
+                body=body
+            )
+            response_body = json.loads(response['body'].read())
+            return response_body['embedding']
+        except Exception as e:
+            if attempt == retries or 'Throttling' not in str(e):
+                raise
+            time.sleep(2 ** attempt)
+
+
+def embed_batch(chunks, rate_limiter: RateLimiter):
+    """Embed a batch of (hash, text) pairs, returning {hash: vector}"""
+    return {h: embed_text(text, rate_limiter) for h, text in chunks}
+
+
+def embed_missing(chunks_by_hash, cache: EmbeddingCache, on_checkpoint=None):
+    """Embed every chunk not already in the cache, in concurrent batches
+
+    on_checkpoint() is called every CACHE_SAVE_EVERY_BATCHES batches so the
+    caller can persist the cache. Returns (vectors, cache_hits, cache_misses)
+    where vectors covers all hashes.
+    """
+    vectors = cache.get_many(chunks_by_hash.keys())
+    missing = [(h, text) for h, text in chunks_by_hash.items() if h not in vectors]
+    hits = len(chunks_by_hash) - len(missing)
+
+    print(f"Embedding cache: {hits} hits, {len(missing)} misses")
+    if not missing:
+        return vectors, hits, 0
+
+    rate_limiter = RateLimiter()
+    batches = [missing[i:i + BATCH_SIZE] for i in range(0, len(missing), BATCH_SIZE)]
+
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        futures = [executor.submit(embed_batch, batch, rate_limiter) for batch in batches]
+        for completed, future in enumerate(as_completed(futures), start=1):
+            batch_vectors = future.result()
+            cache.put_many(batch_vectors)
+            vectors.update(batch_vectors)
+
+            # A Lambda hard timeout skips `finally`, so checkpoint as we go
+            if on_checkpoint and completed % CACHE_SAVE_EVERY_BATCHES == 0:
+                on_checkpoint()
+
+    return vectors, hits, len(missing)
+
+
+def list_source_documents(bucket: str = BUCKET_NAME):
+    """List the text documents in the bucket"""
+    keys = []
+    paginator = s3_client.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=bucket):
+        for obj in page.get('Contents', []):
+            key = obj['Key']
+            if key.lower().endswith(TEXT_EXTENSIONS):
+                keys.append(key)
+    return keys
+
+
+def build_bulk_ndjson(records, vectors):
+    """Format chunks as OpenSearch bulk NDJSON matching the Knowledge Base field mapping
+
+    No _id in the action line - VECTORSEARCH collections reject custom IDs.
+    The metadata carries the source URI the same way Bedrock writes it, so
+    retrieval results can point back at the document.
+    """
+    lines = []
+    for record in records:
+        metadata = {
+            'x-amz-bedrock-kb-source-uri': record['source_uri'],
+            'chunk': record['chunk']
+        }
+        if DATA_SOURCE_ID:
+            metadata['x-amz-bedrock-kb-data-source-id'] = DATA_SOURCE_ID
+
+        lines.append(json.dumps({'index': {}}))
+        lines.append(json.dumps({
+            'embedding': vectors[record['hash']],
+            'text': record['text'],
+            'metadata': json.dumps(metadata)
+        }))
+    return '\n'.join(lines) + '\n'
+
+
+def precompute_embeddings(bucket: str = BUCKET_NAME, output_bucket: str = EMBEDDINGS_BUCKET):
+    """Chunk every document, embed only cache misses and write the vector index load file"""
+    with timed('load_cache'):
+        cache = EmbeddingCache.load_from_s3(output_bucket)
+    try:
+        records = []
+        chunks_by_hash = {}
+
+        with timed('chunk'):
+            for key in list_source_documents(bucket):
+                obj = s3_client.get_object(Bucket=bucket, Key=key)
+                text = obj['Body'].read().decode('utf-8', errors='ignore')
+
+                for i, chunk in enumerate(chunk_text(text)):
+                    h = chunk_hash(chunk)
+                    chunks_by_hash[h] = chunk
+                    records.append({
+                        'hash': h,
+                        'text': chunk,
+                        'source_uri': f"s3://{bucket}/{key}",
+                        'chunk': i
+                    })
+
+        print(f"Chunked {len(records)} chunks ({len(chunks_by_hash)} unique)")
+
+        with timed('embed'):
+            vectors, hits, misses = embed_missing(
+                chunks_by_hash,
+                cache,
+                on_checkpoint=lambda: cache.save_to_s3(output_bucket)
+            )
+
+        with timed('write_output'):
+            s3_client.put_object(
+                Bucket=output_bucket,
+                Key=OUTPUT_KEY,
+                Body=build_bulk_ndjson(records, vectors).encode('utf-8'),
+                ContentType='application/x-ndjson'
+            )
+        print(f"Wrote {len(records)} vectors to s3://{output_bucket}/{OUTPUT_KEY}")
+
+        return {
+            'chunks': len(records),
+            'uniqueChunks': len(chunks_by_hash),
+            'cacheHits': hits,
+            'cacheMisses': misses,
+            'output': f"s3://{output_bucket}/{OUTPUT_KEY}"
+        }
+    finally:
+        try:
+            cache.save_to_s3(output_bucket)
+        except Exception as e:
+            print(f"Warning: Could not save embedding cache: {str(e)}")
+            print(traceback.format_exc())
+        cache.close()
+
+
+@instrument
+def handler(event, context):
+    """Lambda handler for the embeddings job (invoked asynchronously by the documents Lambda)"""
+    try:
+        summary = precompute_embeddings()
+        print(f"Embeddings job finished: {json.dumps(summary)}")
+        return summary
+    except Exception as e:
+        print(f"Error precomputing embeddings: {str(e)}")
+        print(traceback.format_exc())
+        raise
+
+
+mark_initialized()
+
+if __name__ == '__main__':
+    print(json.dumps(precompute_embeddings(), indent=2))
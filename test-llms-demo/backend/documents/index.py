@@ -1,3 +1,7 @@
+# Imported first so the measured init duration covers the rest of the cold start
+# (check_container.py is a symlink to the chat function's copy)
+from check_container import instrument, mark_initialized, register_client
+
 import json
 import os
 import boto3
@@ -7,11 +11,17 @@ import traceback
 
 s3_client = boto3.client('s3')
 bedrock_agent = boto3.client('bedrock-agent', region_name=os.environ['REGION'])
+lambda_client = boto3.client('lambda', region_name=os.environ['REGION'])
+register_client('s3', s3_client)
+register_client('bedrock-agent', bedrock_agent)
+register_client('lambda', lambda_client)
 
 BUCKET_NAME = os.environ['BUCKET_NAME']
 KNOWLEDGE_BASE_ID = os.environ['KNOWLEDGE_BASE_ID']
 DATA_SOURCE_ID = os.environ['DATA_SOURCE_ID']
+EMBEDDINGS_FUNCTION_NAME = os.environ['EMBEDDINGS_FUNCTION_NAME']
 
+@instrument
 def handler(event, context):
     """Lambda handler for document management"""
     try:
@@ -47,6 +57,10 @@ def handler(event, context):
         elif http_method == 'POST' and path == '/sync':
             return sync_knowledge_base()
 
+        # Start the embedding precompute job (cache misses only)
+        elif http_method == 'POST' and path == '/embeddings':
+            return precompute_embeddings_job()
+
         else:
             return {
                 'statusCode': 404,
@@ -231,3 +245,33 @@ def sync_knowledge_base():
             'headers': {'Access-Control-Allow-Origin': '*'},
             'body': json.dumps({'error': str(e)})
         }
+
+def precompute_embeddings_job():
+    """Start the embeddings job asynchronously - it can run far longer than an API request"""
+    try:
+        lambda_client.invoke(
+            FunctionName=EMBEDDINGS_FUNCTION_NAME,
+            InvocationType='Event'
+        )
+
+        return {
+            'statusCode': 202,
+            'headers': {
+                'Content-Type': 'application/json',
+                'Access-Control-Allow-Origin': '*'
+            },
+            'body': json.dumps({
+                'message': 'Embeddings job started'
+            })
+        }
+
+    except Exception as e:
+        print(f"Error starting embeddings job: {str(e)}")
+        print(traceback.format_exc())
+        return {
+            'statusCode': 500,
+            'headers': {'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': str(e)})
+        }
+
+mark_initialized()
@@ -0,0 +1,377 @@
+"""
+Tests for the chunk-level embedding cache and the precompute job
+Run with: python -m unittest test_embeddings
+"""
+
+import io
+import json
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+# embeddings.py reads its configuration at import time
+_cache_dir = tempfile.mkdtemp()
+os.environ.setdefault('REGION', 'us-east-1')
+os.environ.setdefault('BUCKET_NAME', 'docs')
+os.environ.setdefault('EMBEDDINGS_BUCKET', 'embeddings')
+os.environ.setdefault('EMBEDDING_CACHE_PATH', os.path.join(_cache_dir, 'cache.sqlite3'))
+
+import embeddings
+from embeddings import EmbeddingCache, RateLimiter, chunk_hash, chunk_text, embed_missing
+
+
+def tearDownModule():
+    shutil.rmtree(_cache_dir, ignore_errors=True)
+
+
+def words(start, count):
+    return ' '.join(f'word{i}' for i in range(start, start + count))
+
+
+class StubBedrock:
+    """Stub bedrock-runtime client that records every text it embeds"""
+
+    def __init__(self):
+        self.inputs = []
+        self.lock = threading.Lock()
+
+    def invoke_model(self, modelId, body):
+        text = json.loads(body)['inputText']
+        with self.lock:
+            self.inputs.append(text)
+        return {'body': io.BytesIO(json.dumps({'embedding': [float(len(text)), 1.0]}).encode('utf-8'))}
+
+
+class StubS3:
+    """Stub S3 client backed by a dict of (bucket, key) -> bytes"""
+
+    def __init__(self):
+        self.objects = {}
+
+    def get_paginator(self, operation):
+        return self
+
+    def paginate(self, Bucket):
+        yield {'Contents': [{'Key': key} for bucket, key in list(self.objects) if bucket == Bucket]}
+
+    def get_object(self, Bucket, Key):
+        return {'Body': io.BytesIO(self.objects[(Bucket, Key)])}
+
+    def put_object(self, Bucket, Key, Body, **kwargs):
+        self.objects[(Bucket, Key)] = Body
+
+    def download_file(self, bucket, key, path):
+        if (bucket, key) not in self.objects:
+            raise Exception('An error occurred (404) when calling the HeadObject operation: Not Found')
+        with open(path, 'wb') as f:
+            f.write(self.objects[(bucket, key)])
+
+    def upload_file(self, path, bucket, key):
+        with open(path, 'rb') as f:
+            self.objects[(bucket, key)] = f.read()
+
+
+class StubbedClientsTest(unittest.TestCase):
+    """Swaps in the stub clients and a rate limiter that doesn't slow the tests down"""
+
+    def setUp(self):
+        self.bedrock = StubBedrock()
+        self.s3 = StubS3()
+        patches = [
+            mock.patch.object(embeddings, 'bedrock_runtime', self.bedrock),
+            mock.patch.object(embeddings, 's3_client', self.s3),
+            mock.patch.object(embeddings, 'RateLimiter', lambda: RateLimiter(10000))
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+        self.cache_path = os.path.join(_cache_dir, f'{self.id()}.sqlite3')
+        self.addCleanup(self.remove_local_cache)
+
+    def remove_local_cache(self):
+        if os.path.exists(self.cache_path):
+            os.remove(self.cache_path)
+
+    def open_cache(self):
+        cache = EmbeddingCache(self.cache_path)
+        self.addCleanup(cache.close)
+        return cache
+
+
+class ChunkTextTest(unittest.TestCase):
+
+    def assert_valid_chunks(self, text, chunks, chunk_size):
+        for chunk in chunks:
+            self.assertTrue(chunk.strip(), 'empty chunk')
+            self.assertLessEqual(len(chunk), chunk_size)
+            self.assertIn(chunk, text)
+
+    def test_empty_and_blank_text(self):
+        self.assertEqual(chunk_text(''), [])
+        self.assertEqual(chunk_text(' \n\t\r\n '), [])
+
+    def test_short_text_is_one_chunk(self):
+        self.assertEqual(chunk_text('  hello world \n'), ['hello world'])
+
+    def test_breaks_on_any_whitespace(self):
+        for separator in (' ', '\n', '\t', '\r\n'):
+            chunks = chunk_text(f'aaaa{separator}bbbb', chunk_size=6, overlap=1)
+            self.assertEqual(chunks[0], 'aaaa', repr(separator))
+
+    def test_text_without_whitespace_terminates(self):
+        text = 'x' * 5000
+
+        chunks = chunk_text(text, chunk_size=1000, overlap=200)
+
+        self.assert_valid_chunks(text, chunks, 1000)
+        self.assertEqual(chunks[0], 'x' * 1000)
+        self.assertLess(len(chunks), 10)
+
+    def test_long_whitespace_runs_make_no_empty_chunks(self):
+        text = 'start' + ' ' * 3000 + '\n' * 1500 + 'end'
+
+        chunks = chunk_text(text, chunk_size=1000, overlap=200)
+
+        self.assert_valid_chunks(text, chunks, 1000)
+        self.assertEqual(chunks, ['start', 'end'])
+
+    def test_random_text_always_terminates_with_valid_chunks(self):
+        rng = random.Random(0)
+        alphabet = 'ab \n\t'
+        for _ in range(200):
+            text = ''.join(rng.choice(alphabet) for _ in range(rng.randint(0, 400)))
+            chunk_size = rng.randint(2, 50)
+            overlap = rng.randint(0, chunk_size - 1)
+
+            chunks = chunk_text(text, chunk_size=chunk_size, overlap=overlap)
+
+            self.assert_valid_chunks(text, chunks, chunk_size)
+            self.assertLessEqual(len(chunks), len(text))
+            # Chunks overlap or touch, so no text is dropped
+            kept = sum(len(''.join(chunk.split())) for chunk in chunks)
+            self.assertGreaterEqual(kept, len(''.join(text.split())))
+
+
+class ChunkHashTest(unittest.TestCase):
+
+    def test_same_chunk_same_hash(self):
+        self.assertEqual(chunk_hash('some text'), chunk_hash('some text'))
+        self.assertEqual(len(chunk_hash('some text')), 64)
+
+    def test_different_chunk_different_hash(self):
+        self.assertNotEqual(chunk_hash('some text'), chunk_hash('some text.'))
+
+    def test_model_id_is_part_of_the_hash(self):
+        self.assertNotEqual(
+            chunk_hash('some text', model_id='amazon.titan-embed-text-v1'),
+            chunk_hash('some text', model_id='amazon.titan-embed-text-v2:0')
+        )
+
+
+class CountingConnection:
+    """Wraps a sqlite3 connection, recording the parameter count of each query"""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.parameter_counts = []
+
+    def execute(self, sql, parameters=()):
+        self.parameter_counts.append(len(parameters))
+        return self.conn.execute(sql, parameters)
+
+    def __getattr__(self, name):
+        return getattr(self.conn, name)
+
+
+class EmbeddingCacheTest(StubbedClientsTest):
+
+    def test_get_many_returns_only_cached_hashes(self):
+        cache = self.open_cache()
+        cache.put_many({'a': [1.0, 2.0], 'b': [3.0, 4.0]})
+
+        self.assertEqual(cache.get_many(['a', 'b', 'c']), {'a': [1.0, 2.0], 'b': [3.0, 4.0]})
+        self.assertEqual(cache.get_many([]), {})
+
+    def test_put_many_replaces_existing_vectors(self):
+        cache = self.open_cache()
+        cache.put_many({'a': [1.0]})
+        cache.put_many({'a': [2.0]})
+
+        self.assertEqual(cache.get_many(['a']), {'a': [2.0]})
+
+    def test_get_many_batches_bound_parameters(self):
+        cache = self.open_cache()
+        stored = {f'hash{i}': [float(i)] for i in range(1200)}
+        cache.put_many(stored)
+
+        cache.conn = CountingConnection(cache.conn)
+        found = cache.get_many(list(stored) + ['missing'])
+
+        self.assertEqual(found, stored)
+        self.assertEqual(cache.conn.parameter_counts, [500, 500, 201])
+
+    def test_survives_an_s3_round_trip(self):
+        cache = self.open_cache()
+        cache.put_many({'a': [1.0]})
+        cache.save_to_s3('embeddings', 'cache.sqlite3')
+        cache.close()
+        self.remove_local_cache()
+
+        reloaded = EmbeddingCache.load_from_s3('embeddings', 'cache.sqlite3', self.cache_path)
+        self.addCleanup(reloaded.close)
+
+        self.assertEqual(reloaded.get_many(['a']), {'a': [1.0]})
+
+    def test_missing_s3_cache_starts_empty(self):
+        cache = EmbeddingCache.load_from_s3('embeddings', 'cache.sqlite3', self.cache_path)
+        self.addCleanup(cache.close)
+
+        self.assertEqual(cache.get_many(['a']), {})
+
+
+class EmbedMissingTest(StubbedClientsTest):
+
+    def test_embeds_only_cache_misses(self):
+        cache = self.open_cache()
+        chunks_by_hash = {chunk_hash(text): text for text in ['one', 'two', 'three', 'four', 'five']}
+        cached = dict(list(chunks_by_hash.items())[:2])
+        cache.put_many({h: [0.0] for h in cached})
+
+        vectors, hits, misses = embed_missing(chunks_by_hash, cache)
+
+        self.assertEqual((hits, misses), (2, 3))
+        self.assertEqual(sorted(self.bedrock.inputs), sorted(['three', 'four', 'five']))
+        self.assertEqual(set(vectors), set(chunks_by_hash))
+        self.assertEqual(vectors[chunk_hash('one')], [0.0])
+        self.assertEqual(cache.get_many(chunks_by_hash.keys()), vectors)
+
+    def test_all_hits_make_no_model_calls(self):
+        cache = self.open_cache()
+        chunks_by_hash = {chunk_hash(text): text for text in ['one', 'two']}
+        cache.put_many({h: [0.0] for h in chunks_by_hash})
+        checkpoint = mock.Mock()
+
+        vectors, hits, misses = embed_missing(chunks_by_hash, cache, on_checkpoint=checkpoint)
+
+        self.assertEqual((hits, misses), (2, 0))
+        self.assertEqual(self.bedrock.inputs, [])
+        checkpoint.assert_not_called()
+
+    def test_checkpoints_every_few_batches(self):
+        cache = self.open_cache()
+        chunks_by_hash = {chunk_hash(f'chunk {i}'): f'chunk {i}' for i in range(12)}
+        checkpoint = mock.Mock()
+
+        with mock.patch.object(embeddings, 'BATCH_SIZE', 1), \
+                mock.patch.object(embeddings, 'CACHE_SAVE_EVERY_BATCHES', 5):
+            embed_missing(chunks_by_hash, cache, on_checkpoint=checkpoint)
+
+        self.assertEqual(checkpoint.call_count, 2)
+
+
+class PrecomputeEmbeddingsTest(StubbedClientsTest):
+
+    def setUp(self):
+        super().setUp()
+        # The job opens its cache at the configured path
+        self.cache_path = embeddings.CACHE_PATH
+
+    def put_document(self, key, text):
+        self.s3.objects[('docs', key)] = text.encode('utf-8')
+
+    def run_job(self):
+        """One run in a fresh container: the local cache file is gone, only S3 has it"""
+        self.remove_local_cache()
+        self.bedrock.inputs = []
+        return embeddings.precompute_embeddings('docs', 'embeddings')
+
+    def test_second_run_makes_no_model_calls(self):
+        self.put_document('a.txt', words(0, 600))
+        self.put_document('b.md', words(1000, 400))
+
+        first = self.run_job()
+        first_output = self.s3.objects[('embeddings', embeddings.OUTPUT_KEY)]
+        self.assertEqual(first['cacheHits'], 0)
+        self.assertEqual(len(self.bedrock.inputs), first['uniqueChunks'])
+
+        second = self.run_job()
+
+        self.assertEqual(self.bedrock.inputs, [])
+        self.assertEqual(second['cacheHits'], second['uniqueChunks'])
+        self.assertEqual(second['cacheMisses'], 0)
+        self.assertEqual(self.s3.objects[('embeddings', embeddings.OUTPUT_KEY)], first_output)
+
+    def test_edited_document_reembeds_only_changed_chunks(self):
+        original = words(0, 600)
+        self.put_document('a.txt', original)
+        self.put_document('b.txt', words(1000, 400))
+        self.run_job()
+
+        edited = original + ' ' + words(5000, 50)
+        self.put_document('a.txt', edited)
+        summary = self.run_job()
+
+        changed = set(chunk_text(edited)) - set(chunk_text(original))
+        self.assertTrue(changed)
+        self.assertLess(len(changed), len(chunk_text(edited)))
+        self.assertEqual(sorted(self.bedrock.inputs), sorted(changed))
+        self.assertEqual(summary['cacheMisses'], len(changed))
+
+    def test_output_has_one_vector_per_chunk(self):
+        self.put_document('a.txt', words(0, 600))
+        self.put_document('ignored.pdf', 'binary')
+
+        summary = self.run_job()
+
+        lines = self.s3.objects[('embeddings', embeddings.OUTPUT_KEY)].decode('utf-8').splitlines()
+        self.assertEqual(len(lines), 2 * summary['chunks'])
+        document = json.loads(lines[1])
+        self.assertEqual(json.loads(document['metadata'])['x-amz-bedrock-kb-source-uri'], 's3://docs/a.txt')
+        self.assertEqual(document['embedding'], [float(len(document['text'])), 1.0])
+
+
+class RateLimiterTest(unittest.TestCase):
+
+    def test_first_call_does_not_wait(self):
+        limiter = RateLimiter(1)
+
+        start = time.monotonic()
+        limiter.wait()
+
+        self.assertLess(time.monotonic() - start, 0.1)
+
+    def test_spaces_out_calls(self):
+        limiter = RateLimiter(20)
+
+        start = time.monotonic()
+        for _ in range(5):
+            limiter.wait()
+
+        # The first call is free, the next four wait 1/20s each
+        self.assertGreaterEqual(time.monotonic() - start, 0.19)
+
+    def test_limit_is_shared_across_threads(self):
+        limiter = RateLimiter(50)
+
+        def calls():
+            for _ in range(2):
+                limiter.wait()
+
+        start = time.monotonic()
+        threads = [threading.Thread(target=calls) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertGreaterEqual(time.monotonic() - start, 7 / 50 - 0.01)
+
+
+if __name__ == '__main__':
+    unittest.main()
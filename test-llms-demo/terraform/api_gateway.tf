@@ -104,6 +104,35 @@ resource "aws_api_gateway_integration_response" "chat_options" {
   depends_on = [aws_api_gateway_integration.chat_options]
 }
 
+# /chat/{id} resource (async job results)
+resource "aws_api_gateway_resource" "chat_job" {
+  rest_api_id = aws_api_gateway_rest_api.main.id
+  parent_id   = aws_api_gateway_resource.chat.id
+  path_part   = "{id}"
+}
+
+# GET /chat/{id} method
+resource "aws_api_gateway_method" "chat_job_get" {
+  rest_api_id   = aws_api_gateway_rest_api.main.id
+  resource_id   = aws_api_gateway_resource.chat_job.id
+  http_method   = "GET"
+  authorization = "NONE"
+
+  request_parameters = {
+    "method.request.path.id" = true
+  }
+}
+
+# Integration for GET /chat/{id}
+resource "aws_api_gateway_integration" "chat_job_get" {
+  rest_api_id             = aws_api_gateway_rest_api.main.id
+  resource_id             = aws_api_gateway_resource.chat_job.id
+  http_method             = aws_api_gateway_method.chat_job_get.http_method
+  integration_http_method = "POST"
+  type                    = "AWS_PROXY"
+  uri                     = aws_lambda_function.chat.invoke_arn
+}
+
 # /documents resource
 resource "aws_api_gateway_resource" "documents" {
   rest_api_id = aws_api_gateway_rest_api.main.id
@@ -363,6 +392,85 @@ resource "aws_api_gateway_integration_response" "sync_options" {
   depends_on = [aws_api_gateway_integration.sync_options]
 }
 
+# /embeddings resource
+resource "aws_api_gateway_resource" "embeddings" {
+  rest_api_id = aws_api_gateway_rest_api.main.id
+  parent_id   = aws_api_gateway_rest_api.main.root_resource_id
+  path_part   = "embeddings"
+}
+
+# POST /embeddings method
+resource "aws_api_gateway_method" "embeddings_post" {
+  rest_api_id   = aws_api_gateway_rest_api.main.id
+  resource_id   = aws_api_gateway_resource.embeddings.id
+  http_method   = "POST"
+  authorization = "NONE"
+}
+
+# OPTIONS /embeddings method (for CORS)
+resource "aws_api_gateway_method" "embeddings_options" {
+  rest_api_id   = aws_api_gateway_rest_api.main.id
+  resource_id   = aws_api_gateway_resource.embeddings.id
+  http_method   = "OPTIONS"
+  authorization = "NONE"
+}
+
+# Integration for POST /embeddings
+resource "aws_api_gateway_integration" "embeddings_post" {
+  rest_api_id             = aws_api_gateway_rest_api.main.id
+  resource_id             = aws_api_gateway_resource.embeddings.id
+  http_method             = aws_api_gateway_method.embeddings_post.http_method
+  integration_http_method = "POST"
+  type                    = "AWS_PROXY"
+  uri                     = aws_lambda_function.documents.invoke_arn
+}
+
+# Mock integration for OPTIONS /embeddings
+resource "aws_api_gateway_integration" "embeddings_options" {
+  rest_api_id = aws_api_gateway_rest_api.main.id
+  resource_id = aws_api_gateway_resource.embeddings.id
+  http_method = aws_api_gateway_method.embeddings_options.http_method
+  type        = "MOCK"
+
+  request_templates = {
+    "application/json" = "{\"statusCode\": 200}"
+  }
+}
+
+# Method response for OPTIONS /embeddings
+resource "aws_api_gateway_method_response" "embeddings_options" {
+  rest_api_id = aws_api_gateway_rest_api.main.id
+  resource_id = aws_api_gateway_resource.embeddings.id
+  http_method = aws_api_gateway_method.embeddings_options.http_method
+  status_code = "200"
+
+  response_parameters = {
+    "method.response.header.Access-Control-Allow-Headers" = true
+    "method.response.header.Access-Control-Allow-Methods" = true
+    "method.response.header.Access-Control-Allow-Origin"  = true
+  }
+
+  response_models = {
+    "application/json" = "Empty"
+  }
+}
+
+# Integration response for OPTIONS /embeddings
+resource "aws_api_gateway_integration_response" "embeddings_options" {
+  rest_api_id = aws_api_gateway_rest_api.main.id
+  resource_id = aws_api_gateway_resource.embeddings.id
+  http_method = aws_api_gateway_method.embeddings_options.http_method
+  status_code = aws_api_gateway_method_response.embeddings_options.status_code
+
+  response_parameters = {
+    "method.response.header.Access-Control-Allow-Headers" = "'Content-Type,X-Amz-Date,Authorization,X-Api-Key,X-Amz-Security-Token'"
+    "method.response.header.Access-Control-Allow-Methods" = "'GET,POST,DELETE,OPTIONS'"
+    "method.response.header.Access-Control-Allow-Origin"  = "'*'"
+  }
+
+  depends_on = [aws_api_gateway_integration.embeddings_options]
+}
+
 # API Gateway Deployment
 resource "aws_api_gateway_deployment" "main" {
   rest_api_id = aws_api_gateway_rest_api.main.id
@@ -372,6 +480,9 @@ resource "aws_api_gateway_deployment" "main" {
       aws_api_gateway_resource.chat.id,
       aws_api_gateway_method.chat_post.id,
       aws_api_gateway_integration.chat_post.id,
+      aws_api_gateway_resource.chat_job.id,
+      aws_api_gateway_method.chat_job_get.id,
+      aws_api_gateway_integration.chat_job_get.id,
       aws_api_gateway_resource.documents.id,
       aws_api_gateway_method.documents_get.id,
       aws_api_gateway_method.documents_post.id,
@@ -383,6 +494,9 @@ resource "aws_api_gateway_deployment" "main" {
       aws_api_gateway_resource.sync.id,
       aws_api_gateway_method.sync_post.id,
       aws_api_gateway_integration.sync_post.id,
+      aws_api_gateway_resource.embeddings.id,
+      aws_api_gateway_method.embeddings_post.id,
+      aws_api_gateway_integration.embeddings_post.id,
     ]))
   }
 
@@ -392,10 +506,12 @@ resource "aws_api_gateway_deployment" "main" {
 
   depends_on = [
     aws_api_gateway_integration.chat_post,
+    aws_api_gateway_integration.chat_job_get,
     aws_api_gateway_integration.documents_get,
     aws_api_gateway_integration.documents_post,
     aws_api_gateway_integration.document_delete,
     aws_api_gateway_integration.sync_post,
+    aws_api_gateway_integration.embeddings_post,
   ]
 }
 
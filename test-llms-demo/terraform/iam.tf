@@ -131,9 +131,28 @@ resource "aws_iam_role_policy" "lambda_s3" {
         ]
         Resource = [
           aws_s3_bucket.documents.arn,
-          "${aws_s3_bucket.documents.arn}/*"
+          "${aws_s3_bucket.documents.arn}/*",
+          aws_s3_bucket.embeddings.arn,
+          "${aws_s3_bucket.embeddings.arn}/*"
         ]
       }
     ]
   })
 }
+
+# Policy for the documents Lambda to start the embeddings job
+resource "aws_iam_role_policy" "lambda_invoke_embeddings" {
+  name = "${local.project_name}-lambda-invoke-embeddings-policy"
+  role = aws_iam_role.lambda.id
+
+  policy = jsonencode({
+    Version = "2012-10-17"
+    Statement = [
+      {
+        Effect   = "Allow"
+        Action   = "lambda:InvokeFunction"
+        Resource = aws_lambda_function.embeddings.arn
+      }
+    ]
+  })
+}
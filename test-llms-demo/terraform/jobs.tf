@@ -0,0 +1,95 @@
+# Async chat jobs: SQS queue for submitted jobs, DynamoDB table for results
+
+# Dead-letter queue for jobs that keep failing
+resource "aws_sqs_queue" "chat_jobs_dlq" {
+  name                      = "${local.project_name}-chat-jobs-dlq"
+  message_retention_seconds = 1209600
+
+  tags = {
+    Name    = "${local.project_name}-chat-jobs-dlq"
+    Project = local.project_name
+  }
+}
+
+# Queue of submitted chat job IDs
+resource "aws_sqs_queue" "chat_jobs" {
+  name = "${local.project_name}-chat-jobs"
+
+  # Must be at least the chat Lambda timeout
+  visibility_timeout_seconds = var.lambda_timeout * 2
+  message_retention_seconds  = 3600
+
+  # One retry, then give up - each attempt reruns all three generations
+  redrive_policy = jsonencode({
+    deadLetterTargetArn = aws_sqs_queue.chat_jobs_dlq.arn
+    maxReceiveCount     = local.chat_jobs_max_receive_count
+  })
+
+  tags = {
+    Name    = "${local.project_name}-chat-jobs"
+    Project = local.project_name
+  }
+}
+
+# Partial and final per-model results, keyed by job ID
+resource "aws_dynamodb_table" "chat_jobs" {
+  name         = "${local.project_name}-chat-jobs"
+  billing_mode = "PAY_PER_REQUEST"
+  hash_key     = "jobId"
+
+  attribute {
+    name = "jobId"
+    type = "S"
+  }
+
+  ttl {
+    attribute_name = "ttl"
+    enabled        = true
+  }
+
+  tags = {
+    Name    = "${local.project_name}-chat-jobs"
+    Project = local.project_name
+  }
+}
+
+# Deliver queued jobs to the chat Lambda (worker mode)
+resource "aws_lambda_event_source_mapping" "chat_jobs" {
+  event_source_arn = aws_sqs_queue.chat_jobs.arn
+  function_name    = aws_lambda_function.chat.arn
+  batch_size       = 1
+
+  # The handler returns failed messages in batchItemFailures instead of raising
+  function_response_types = ["ReportBatchItemFailures"]
+}
+
+# Policy for Lambda to use the job queue and result table
+resource "aws_iam_role_policy" "lambda_chat_jobs" {
+  name = "${local.project_name}-lambda-chat-jobs-policy"
+  role = aws_iam_role.lambda.id
+
+  policy = jsonencode({
+    Version = "2012-10-17"
+    Statement = [
+      {
+        Effect = "Allow"
+        Action = [
+          "sqs:SendMessage",
+          "sqs:ReceiveMessage",
+          "sqs:DeleteMessage",
+          "sqs:GetQueueAttributes"
+        ]
+        Resource = aws_sqs_queue.chat_jobs.arn
+      },
+      {
+        Effect = "Allow"
+        Action = [
+          "dynamodb:PutItem",
+          "dynamodb:GetItem",
+          "dynamodb:UpdateItem"
+        ]
+        Resource = aws_dynamodb_table.chat_jobs.arn
+      }
+    ]
+  })
+}
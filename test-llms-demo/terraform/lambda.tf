@@ -25,8 +25,13 @@ resource "aws_lambda_function" "chat" {
 
   environment {
     variables = {
-      KNOWLEDGE_BASE_ID = aws_bedrockagent_knowledge_base.main.id
-      REGION            = data.aws_region.current.name
+      KNOWLEDGE_BASE_ID      = aws_bedrockagent_knowledge_base.main.id
+      KNOWLEDGE_BASE_IDS     = join(",", concat([aws_bedrockagent_knowledge_base.main.id], var.additional_knowledge_base_ids))
+      RETRIEVAL_MERGE        = var.retrieval_merge
+      REGION                 = data.aws_region.current.name
+      JOBS_TABLE             = aws_dynamodb_table.chat_jobs.name
+      JOBS_QUEUE_URL         = aws_sqs_queue.chat_jobs.url
+      JOBS_MAX_RECEIVE_COUNT = local.chat_jobs_max_receive_count
     }
   }
 
@@ -49,10 +54,11 @@ resource "aws_lambda_function" "documents" {
 
   environment {
     variables = {
-      BUCKET_NAME       = aws_s3_bucket.documents.bucket
-      KNOWLEDGE_BASE_ID = aws_bedrockagent_knowledge_base.main.id
-      DATA_SOURCE_ID    = aws_bedrockagent_data_source.s3.data_source_id
-      REGION            = data.aws_region.current.name
+      BUCKET_NAME              = aws_s3_bucket.documents.bucket
+      KNOWLEDGE_BASE_ID        = aws_bedrockagent_knowledge_base.main.id
+      DATA_SOURCE_ID           = aws_bedrockagent_data_source.s3.data_source_id
+      REGION                   = data.aws_region.current.name
+      EMBEDDINGS_FUNCTION_NAME = aws_lambda_function.embeddings.function_name
     }
   }
 
@@ -62,6 +68,41 @@ resource "aws_lambda_function" "documents" {
   }
 }
 
+# Embedding precompute job - same package as the documents function, started
+# asynchronously by POST /embeddings so it isn't bound by the API timeout
+resource "aws_lambda_function" "embeddings" {
+  filename         = data.archive_file.doc_lambda.output_path
+  function_name    = "${local.project_name}-embeddings"
+  role             = aws_iam_role.lambda.arn
+  handler          = "embeddings.handler"
+  source_code_hash = data.archive_file.doc_lambda.output_base64sha256
+  runtime          = "python3.11"
+  timeout          = 900
+  memory_size      = var.embeddings_lambda_memory
+
+  environment {
+    variables = {
+      BUCKET_NAME        = aws_s3_bucket.documents.bucket
+      EMBEDDINGS_BUCKET  = aws_s3_bucket.embeddings.bucket
+      DATA_SOURCE_ID     = aws_bedrockagent_data_source.s3.data_source_id
+      REGION             = data.aws_region.current.name
+      EMBEDDING_MODEL_ID = var.embedding_model_id
+    }
+  }
+
+  tags = {
+    Name    = "${local.project_name}-embeddings"
+    Project = local.project_name
+  }
+}
+
+# Don't re-run a failed job automatically - the cache keeps its progress, so
+# starting it again is cheap
+resource "aws_lambda_function_event_invoke_config" "embeddings" {
+  function_name          = aws_lambda_function.embeddings.function_name
+  maximum_retry_attempts = 0
+}
+
 # Lambda permissions for API Gateway to invoke chat function
 resource "aws_lambda_permission" "chat_api_gateway" {
   statement_id  = "AllowAPIGatewayInvoke"
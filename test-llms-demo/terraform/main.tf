@@ -44,7 +44,11 @@ resource "random_string" "bucket_suffix" {
 locals {
   project_name        = var.project_name
   document_bucket     = "${var.project_name}-docs-${data.aws_caller_identity.current.account_id}"
+  embeddings_bucket   = "${var.project_name}-embeddings-${data.aws_caller_identity.current.account_id}"
   frontend_bucket     = "${var.project_name}-frontend-${random_string.bucket_suffix.result}"
   collection_name     = "${var.project_name}-vectors"
   knowledge_base_name = "${var.project_name}-kb"
+
+  # Deliveries of a chat job before it is dead-lettered
+  chat_jobs_max_receive_count = 2
 }
@@ -29,6 +29,17 @@ resource "aws_s3_bucket_cors_configuration" "documents" {
   }
 }
 
+# S3 Bucket for the embedding cache and precomputed vectors
+# Kept apart from the documents bucket so Knowledge Base syncs never ingest them
+resource "aws_s3_bucket" "embeddings" {
+  bucket = local.embeddings_bucket
+
+  tags = {
+    Name    = "${local.project_name}-embeddings"
+    Project = local.project_name
+  }
+}
+
 # S3 Bucket for Frontend Hosting
 resource "aws_s3_bucket" "frontend" {
   bucket = local.frontend_bucket
@@ -28,12 +28,35 @@ variable "doc_lambda_memory" {
   default     = 256
 }
 
+variable "embeddings_lambda_memory" {
+  description = "Memory size for the embedding precompute Lambda function in MB"
+  type        = number
+  default     = 1024
+}
+
 variable "embedding_model_id" {
   description = "Bedrock embedding model ID for knowledge base"
   type        = string
   default     = "amazon.titan-embed-text-v1"
 }
 
+variable "additional_knowledge_base_ids" {
+  description = "Extra Bedrock Knowledge Base IDs the chat function queries alongside the main one (federated retrieval). With retrieval_merge = \"score\" they must use the same embedding model and similarity metric as the main one"
+  type        = list(string)
+  default     = []
+}
+
+variable "retrieval_merge" {
+  description = "How federated results are merged: \"score\" (raw scores, shards share one embedding model) or \"rrf\" (reciprocal rank fusion, for shards with different embedding models)"
+  type        = string
+  default     = "score"
+
+  validation {
+    condition     = contains(["score", "rrf"], var.retrieval_merge)
+    error_message = "retrieval_merge must be \"score\" or \"rrf\"."
+  }
+}
+
 variable "opensearch_index_name" {
   description = "Name of the vector index in OpenSearch Serverless"
   type        = string